@@ -0,0 +1,203 @@
+# Runs AI-generated pandas code: validated against an AST allow-list in the app
+# process, then executed in a child process with a timeout and a memory cap.
+# The DataFrame is passed both ways as an Arrow IPC stream.
+import ast
+import functools
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TIMEOUT_SECONDS = 30
+MEMORY_LIMIT_BYTES = 4 << 30
+
+# --- AST allow-list and restricted globals ---
+_ALLOWED_IMPORTS = {"pandas", "numpy", "re"}
+
+ALLOWED_NODES = {
+    ast.Module, ast.Expr, ast.Assign, ast.AugAssign, ast.Delete, ast.If, ast.For, ast.Pass, ast.Break,
+    ast.Continue, ast.Import, ast.ImportFrom, ast.alias,
+    ast.Name, ast.Load, ast.Store, ast.Del, ast.Constant, ast.Attribute, ast.Subscript, ast.Slice,
+    ast.Call, ast.keyword, ast.Starred, ast.List, ast.Tuple, ast.Dict, ast.Set,
+    ast.ListComp, ast.DictComp, ast.SetComp, ast.GeneratorExp, ast.comprehension,
+    ast.Lambda, ast.arguments, ast.arg, ast.IfExp, ast.JoinedStr, ast.FormattedValue,
+    ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd, ast.Invert,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.BitAnd, ast.BitOr, ast.BitXor, ast.LShift, ast.RShift,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot, ast.In, ast.NotIn,
+}
+
+# numba compiles each lambda afresh in every child; measured in fresh processes it only
+# beats .apply from roughly 1.5M rows, so the threshold sits above that break-even
+_JIT_MIN_ROWS = 2_000_000
+
+def _jit_map(series, fn):
+    # Compile a numeric row-wise lambda with numba on large columns
+    if len(series) < _JIT_MIN_ROWS:
+        return series.apply(fn)
+    try:
+        # Imported here so children that never reach this path don't pay for it
+        import numba
+    except ImportError:
+        return series.apply(fn)
+    values = series.to_numpy(dtype="float64", na_value=np.nan) if series.hasnans else series.to_numpy()
+    try:
+        result = numba.vectorize(fn)(values)
+    except Exception:
+        # numba only supports a subset of Python; anything else runs as before
+        return series.apply(fn)
+    if result.dtype.kind not in "biuf":
+        return series.apply(fn)
+    return pd.Series(result, index=series.index, name=series.name)
+
+def _safe_import(name, *args, **kwargs):
+    if name.split(".")[0] not in _ALLOWED_IMPORTS:
+        raise ImportError(f"import of '{name}' is not allowed")
+    return __import__(name, *args, **kwargs)
+
+SAFE_GLOBALS = {
+    "__builtins__": {
+        "__import__": _safe_import,
+        "abs": abs, "all": all, "any": any, "bool": bool, "dict": dict, "enumerate": enumerate,
+        "filter": filter, "float": float, "int": int, "isinstance": isinstance, "len": len,
+        "list": list, "map": map, "max": max, "min": min, "print": print, "range": range,
+        "round": round, "set": set, "sorted": sorted, "str": str, "sum": sum, "tuple": tuple, "zip": zip,
+    },
+    "pd": pd,
+    "pd_notna": pd.notna,
+    "_jit_map": _jit_map,
+}
+
+# Submodules that lead to the file system or the interpreter (pd.io.common.os, np.lib, ...)
+_BLOCKED_ATTRS = {
+    "io", "core", "api", "lib", "os", "sys", "compat", "testing", "f2py", "ctypeslib", "distutils",
+    "load", "save", "savez", "savez_compressed", "loadtxt", "savetxt", "genfromtxt", "fromfile", "tofile", "memmap",
+    "fromregex", "dump", "ExcelFile", "ExcelWriter", "HDFStore",
+    # pandas parses these string arguments itself, out of reach of the AST check
+    "eval", "query",
+}
+# pandas' writers; in-memory conversions such as to_list or to_period stay allowed
+_BLOCKED_WRITERS = {
+    "to_csv", "to_excel", "to_pickle", "to_parquet", "to_json", "to_hdf", "to_sql", "to_feather",
+    "to_stata", "to_html", "to_latex", "to_markdown", "to_xml", "to_clipboard", "to_orc",
+}
+
+def _blocked_name(name):
+    # read_* covers pandas' readers
+    return name.startswith("_") or name.startswith("read_") or name in _BLOCKED_ATTRS or name in _BLOCKED_WRITERS
+
+def _validate(tree):
+    for node in ast.walk(tree):
+        if type(node) not in ALLOWED_NODES:
+            raise ValueError(f"disallowed construct in generated code: {type(node).__name__}")
+        if isinstance(node, ast.Attribute) and _blocked_name(node.attr):
+            raise ValueError(f"disallowed attribute in generated code: {node.attr}")
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+            names = []
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module or ""]
+            names = [alias.name for alias in node.names]
+        else:
+            continue
+        for module in modules:
+            parts = module.split(".")
+            if parts[0] not in _ALLOWED_IMPORTS or any(_blocked_name(part) for part in parts[1:]):
+                raise ValueError(f"disallowed import in generated code: {module}")
+        for name in names:
+            if name == "*" or _blocked_name(name):
+                raise ValueError(f"disallowed import in generated code: {name}")
+
+@functools.lru_cache(maxsize=128)
+def _compile(src):
+    # Parse and validate once per unique source; the code object is reused afterwards
+    tree = ast.parse(src)
+    _validate(tree)
+    return compile(tree, "<ai-code>", "exec")
+
+def _exec(src, df):
+    scope = dict(SAFE_GLOBALS, df=df)
+    exec(_compile(src), scope)
+    return scope["df"]
+
+# --- Arrow IPC transport ---
+def _arrow_safe(df):
+    # Mixed-type object columns (e.g. IDs holding both 1 and "A2") can't be encoded; send them as text
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            try:
+                pa.array(df[col], from_pandas=True)
+            except pa.ArrowException:
+                df[col] = df[col].astype("string")
+    return df
+
+def _to_ipc(df):
+    try:
+        table = pa.Table.from_pandas(df)
+    except pa.ArrowException:
+        table = pa.Table.from_pandas(_arrow_safe(df))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _from_ipc(data):
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+# --- Parent side ---
+def run_code(src, df, timeout=TIMEOUT_SECONDS):
+    # Reject disallowed code here, before paying for a child process
+    _compile(src)
+
+    # Never falls back to running in-process: that would bypass the timeout and memory cap
+    payload = _to_ipc(df)
+
+    code = src.encode("utf-8")
+    try:
+        result = subprocess.run(
+            [sys.executable, __file__],
+            input=len(code).to_bytes(4, "big") + code + payload,
+            capture_output=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise TimeoutError(f"generated code timed out after {timeout} seconds") from None
+
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise RuntimeError(message[-1] if message else f"generated code exited with status {result.returncode}")
+    return _from_ipc(result.stdout)
+
+# --- Child side ---
+def _child():
+    if resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (MEMORY_LIMIT_BYTES, MEMORY_LIMIT_BYTES))
+
+    # stdout carries the Arrow result; anything the generated code prints goes to stderr instead
+    result_out = sys.stdout.buffer
+    sys.stdout = sys.stderr
+
+    data = sys.stdin.buffer.read()
+    size = int.from_bytes(data[:4], "big")
+    src = data[4:4 + size].decode("utf-8")
+    df = _from_ipc(data[4 + size:])
+
+    try:
+        df = _exec(src, df)
+        out = _to_ipc(df)
+    except MemoryError:
+        sys.exit("MemoryError: generated code exceeded the memory limit")
+    except Exception as e:
+        # Keep the exception type in the message; the app matches on it for friendly errors
+        sys.exit(f"{type(e).__name__}: {e}")
+    result_out.write(out)
+
+if __name__ == "__main__":
+    _child()
@@ -1,189 +1,398 @@
+import ast
+import hashlib
 import os
 import re
-import textwrap
+import uuid
+from io import BytesIO
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import streamlit as st
 from groq import Groq
+from code_runner import run_code
 
 # --- API Key Handling ---
-if "GROQ_API_KEY" in st.secrets:
-    api_key = st.secrets["GROQ_API_KEY"]
-else:
+def load_api_key():
+    if "GROQ_API_KEY" in st.secrets:
+        return st.secrets["GROQ_API_KEY"]
+
     from dotenv import load_dotenv
     load_dotenv()
     api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        st.error("GROQ API key not found. Please set it in Streamlit secrets (Cloud) or .env (local).")
+        st.stop()
+    return api_key
 
-if not api_key:
-    st.error("GROQ API key not found. Please set it in Streamlit secrets (Cloud) or .env (local).")
-    st.stop()
+# Groq client is kept across reruns so its connection pool is reused
+@st.cache_resource
+def get_client(key):
+    return Groq(api_key=key)
 
-# Initialize Groq client
-client = Groq(api_key=api_key)
+# --- AI prompt ---
+PROMPT_TEMPLATE = """
+You are a safe and reliable Python data cleaning assistant.
 
-# --- Streamlit UI ---
-st.title("Excel Data Cleaner with AI Prompts (Groq Version)")
+IMPORTANT:
+- You are working with an existing pandas DataFrame called `df` that is already loaded in memory.
+- You MUST modify `df` **in place** — do NOT reassign it with new data from scratch.
+- Do NOT read files or create new DataFrames unless explicitly told.
+- Do NOT drop all data or reset the index unless explicitly told.
+- Always check if a column exists before modifying or dropping it.
+- Handle NaN values safely to avoid errors.
+- Columns are Arrow-backed; use vectorized .str methods instead of .apply for string operations:
+  df['col'] = df['col'].astype('string').str.<method>(...)
+- Never call .upper(), .lower(), .split() directly on a Series — always use .str as above.
+- Do not change numeric, percentage, or time formats unless explicitly instructed.
+- When parsing dates, always use:
+  pd.to_datetime(df['col'].astype(str).str.strip(), errors='coerce')
+- Avoid hardcoding example values — make your logic general.
+- Return ONLY Python code that modifies `df` in place, without explanations or markdown.
+
+Here are the first 10 rows of the current data:
+{preview}
+
+User instruction:
+{user_prompt}"""
+
+def build_prompt(df, user_prompt, df_id):
+    # The preview CSV is cached per DataFrame state, so prompt-only edits skip it
+    return PROMPT_TEMPLATE.format(preview=_preview_csv(df_id, df), user_prompt=user_prompt)
+
+# --- Line filter patterns (compiled once) ---
+_PAT_LINE = re.compile(r"^[A-Za-z_][A-Za-z0-9_\[\]'\"]*\s*=.*")
+_PAT_STMT = re.compile(r"^(df|pd|if|for|from|import|with)\b")
+
+def _is_code_line(stripped):
+    if not stripped or stripped.startswith("#"):
+        return False
+    return bool(_PAT_LINE.match(stripped) or _PAT_STMT.match(stripped))
+
+# --- Auto-fixes (single AST pass over the generated code) ---
+def _is_df_column(node):
+    return isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == "df"
+
+def _expr(src):
+    return ast.parse(src, mode="eval").body
+
+def _safe_split(col, sep, idx):
+    # Vectorized; .str[idx] yields NA when a value has fewer parts
+    return f"{col}.astype('string').str.split({sep!r}, n={idx + 1}, regex=False).str[{idx}]"
+
+class _CodeFixer(ast.NodeTransformer):
+    def __init__(self, numeric_cols=frozenset()):
+        self.numeric_cols = numeric_cols
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = node.func
+        if not isinstance(func, ast.Attribute):
+            return node
+
+        # pd.to_datetime(x, format=...) -> pd.to_datetime(x.astype(str).str.strip(), errors='coerce')
+        if (func.attr == "to_datetime" and isinstance(func.value, ast.Name) and func.value.id == "pd"
+                and node.args and any(k.arg == "format" for k in node.keywords)):
+            return _expr(f"pd.to_datetime({ast.unparse(node.args[0])}.astype(str).str.strip(), errors='coerce')")
+
+        # df['col'].upper() -> df['col'].astype('string').str.upper()
+        if func.attr == "upper" and _is_df_column(func.value) and not node.args:
+            return _expr(f"{ast.unparse(func.value)}.astype('string').str.upper()")
+
+        # df['num'].apply(lambda x: ...) -> _jit_map(df['num'], lambda x: ...) on numeric columns
+        if (func.attr == "apply" and _is_df_column(func.value)
+                and isinstance(func.value.slice, ast.Constant) and func.value.slice.value in self.numeric_cols
+                and len(node.args) == 1 and not node.keywords
+                and isinstance(node.args[0], ast.Lambda) and len(node.args[0].args.args) == 1):
+            return ast.Call(func=ast.Name(id="_jit_map", ctx=ast.Load()), args=[func.value, node.args[0]], keywords=[])
+
+        return node
+
+    def visit_Subscript(self, node):
+        self.generic_visit(node)
+        call = node.value
+
+        # df['col'].split(sep)[k] / df['col'].str.split(sep)[k] -> vectorized .str split
+        if (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute) and call.func.attr == "split"
+                and len(call.args) == 1 and not call.keywords
+                and isinstance(call.args[0], ast.Constant) and isinstance(call.args[0].value, str)
+                and isinstance(node.slice, ast.Constant) and type(node.slice.value) is int):
+            receiver = call.func.value
+            if isinstance(receiver, ast.Attribute) and receiver.attr == "str":
+                receiver = receiver.value
+            if _is_df_column(receiver):
+                return _expr(_safe_split(ast.unparse(receiver), call.args[0].value, node.slice.value))
+
+        return node
+
+def _apply_fixes(code, numeric_cols=frozenset()):
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        # Leave it to exec() to report the problem to the user
+        return code
+    return ast.unparse(ast.fix_missing_locations(_CodeFixer(numeric_cols).visit(tree)))
+
+def sanitize_code(raw_code, numeric_cols=frozenset()):
+    raw_code = raw_code.replace("```python", "").replace("```", "").strip()
+
+    # Keep only lines that look like Python code, removing their common indentation
+    python_lines = [line for line in raw_code.splitlines() if _is_code_line(line.strip())]
+    min_indent = min((len(line) - len(line.lstrip()) for line in python_lines), default=0)
+    clean_code = "\n".join(line[min_indent:] for line in python_lines)
+
+    # --- Auto-fixes ---
+    return _apply_fixes(clean_code, numeric_cols)
+
+def numeric_columns(df):
+    return frozenset(
+        col for col, dtype in df.dtypes.items()
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+    )
+
+# --- Cached file parsing ---
+@st.cache_data(show_spinner=False)
+def load_df(name, data):
+    if name.endswith(".csv"):
+        df = pd.read_csv(BytesIO(data), engine="pyarrow", dtype_backend="pyarrow")
+    else:
+        try:
+            df = pd.read_excel(BytesIO(data), engine="calamine")
+        except ImportError:
+            # python-calamine not installed; openpyxl is much slower but always works
+            df = pd.read_excel(BytesIO(data), engine="openpyxl")
+    # Arrow-backed columns: compact string buffers and vectorized .str kernels
+    return df.convert_dtypes(dtype_backend="pyarrow")
+
+# --- Cached Groq completions ---
+@st.cache_data(ttl=3600, show_spinner=False)
+def _groq_complete(_client, model, prompt_text):
+    response = _client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt_text}],
+        temperature=0,
+        max_tokens=1024,
+        stream=True
+    )
+
+    # Stop generating as soon as the code block is closed; anything after it is prose
+    text = ""
+    finish_reason = None
+    for chunk in response:
+        if chunk.choices:
+            text += chunk.choices[0].delta.content or ""
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+        if text.count("```") >= 2:
+            response.close()
+            break
+
+    # Truncated code still parses and would apply only part of the change; raising keeps it out of the cache
+    if finish_reason == "length":
+        raise RuntimeError("The AI response was cut off at the token limit. Please try a shorter instruction.")
+    return text
 
-uploaded_file = st.file_uploader("Upload Excel/CSV file", type=["xlsx", "csv"])
+# --- Cached prompt preview ---
+@st.cache_data(show_spinner=False, max_entries=32)
+def _preview_csv(df_id, _df):
+    # `df_id` (upload id, edit count) identifies the DataFrame state, as for _csv_bytes
+    return _df.head(10).to_csv(index=False)
 
-# --- Keep DataFrame in session state ---
-if uploaded_file is not None:
-    if "df" not in st.session_state:
-        if uploaded_file.name.endswith(".csv"):
-            st.session_state.df = pd.read_csv(uploaded_file)
+# --- Cached CSV export ---
+_NEEDS_QUOTING = r'[,"\r\n]'
+
+def _arrow_csv_table(df):
+    # An Arrow table whose CSV text is byte-for-byte what to_csv writes, or None when it wouldn't be
+    if len(df.columns) < 2:
+        # to_csv quotes an empty lone field; Arrow doesn't
+        return None
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except pa.ArrowException:
+        # Mixed-type object columns aren't supported
+        return None
+
+    columns = []
+    for col in table.columns:
+        if pa.types.is_integer(col.type):
+            columns.append(col)
+        elif pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+            # to_csv quotes only the values that need it; Arrow would quote every string
+            if pc.any(pc.match_substring_regex(col, _NEEDS_QUOTING)).as_py():
+                return None
+            columns.append(col)
+        elif pa.types.is_boolean(col.type):
+            # Arrow writes true/false
+            columns.append(pc.if_else(col, "True", "False"))
         else:
-            st.session_state.df = pd.read_excel(uploaded_file)
+            # Floats, timestamps and nested values (lists) are formatted differently
+            return None
+    return pa.Table.from_arrays(columns, names=table.column_names)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _csv_bytes(df_id, _df):
+    # `_df` is excluded from Streamlit's hashing; `df_id` (upload id, edit count) is the cache key
+    table = _arrow_csv_table(_df)
+    if table is None:
+        return _df.to_csv(index=False).encode("utf-8")
+
+    # Arrow writes UTF-8 straight from the columns, without building a Python str first
+    buf = BytesIO()
+    buf.write(_df.head(0).to_csv(index=False).encode("utf-8"))
+    pacsv.write_csv(table, buf, pacsv.WriteOptions(include_header=False, quoting_style="none"))
+    return buf.getvalue()
+
+# --- Column change detection ---
+def _hash(obj):
+    # Digest of the per-row hashes; unlike their sum it is order- and length-sensitive
+    try:
+        row_hashes = pd.util.hash_pandas_object(obj, index=False).values
+    except TypeError:
+        # Unhashable cells such as lists (e.g. after str.split); hash their text instead
+        row_hashes = pd.util.hash_pandas_object(obj.astype(str), index=False).values
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+
+def _column_hashes(df):
+    return _hash(df.index.to_series()), {col: _hash(df[col]) for col in df.columns}
+
+def _changed_columns(pre_hashes, df):
+    # Returns (added or modified columns, removed columns); a rename shows up in both
+    index_hash, column_hashes = pre_hashes
+    removed = [col for col in column_hashes if col not in df.columns]
+    # Row changes (drops, filters, sorts) touch every column
+    if _hash(df.index.to_series()) != index_hash:
+        return list(df.columns), removed
+    return [col for col in df.columns if column_hashes.get(col) != _hash(df[col])], removed
+
+# --- Friendly error messages ---
+def friendly_error(e):
+    error_message = str(e).lower()
+
+    if "can only use .str accessor" in error_message:
+        return (
+            "Your instruction is trying to use a text operation "
+            "on a column that is not plain text. "
+            "You may need to first convert it to text before making this change."
+        )
+    if "keyerror" in error_message:
+        return (
+            "You mentioned a column name that doesn't exist in the data. "
+            "Please check the exact name and try again."
+        )
+    if "disallowed" in error_message:
+        return (
+            "The generated code tried to do something that isn't allowed here. "
+            "Please rephrase your instruction as a change to the data only."
+        )
+    if "timed out" in error_message or "memory limit" in error_message:
+        return (
+            "Your change took too long or used too much memory and was stopped. "
+            "Please try a simpler instruction."
+        )
+    if "valueerror" in error_message:
+        return (
+            "Your change doesn't match the data format. "
+            "Please adjust your instructions."
+        )
+    return (
+        "Something went wrong while applying your change. "
+        "Please review your instructions and try again."
+    )
+
+# --- Streamlit UI ---
+def apply_changes(client, df, user_prompt, preview_rows):
+    try:
+        # Only ask Groq again when the instruction has changed
+        if st.session_state.get("prompt") != user_prompt:
+            df_id = (st.session_state.data_id, st.session_state.edits)
+            raw_code = _groq_complete(client, "llama-3.1-8b-instant", build_prompt(df, user_prompt, df_id))
+            st.session_state.raw_code = raw_code
+            st.session_state.clean_code = sanitize_code(raw_code, numeric_columns(df))
+            st.session_state.prompt = user_prompt
+
+        clean_code = st.session_state.clean_code
+
+        # Show generated code for review
+        st.write("### Generated Code")
+        st.code(clean_code, language="python")
+
+        # --- Execute with friendly error handling ---
+        # Snapshot column hashes to show only what the change touched
+        pre_hashes = _column_hashes(df)
+        try:
+            df = run_code(clean_code, df)
+            st.session_state.df = df
+            st.session_state.edits += 1
+            st.success("Changes applied successfully!")
+        except Exception as e:
+            st.error(friendly_error(e))
+            st.info("No changes have been made. Please correct your prompt and try again.")
+            st.code(clean_code, language="python")
+            return
+
+        # Show only the columns the change touched
+        st.write("### Updated Data")
+        changed, removed = _changed_columns(pre_hashes, df)
+        if removed:
+            st.caption(f"Removed columns: {', '.join(map(str, removed))}")
+        if changed and len(changed) < len(df.columns):
+            st.caption(f"Showing {len(changed)} of {len(df.columns)} columns that changed")
+        updated = st.empty()
+        if len(changed) == len(df.columns):
+            updated.dataframe(df.head(preview_rows))
+        elif changed:
+            updated.dataframe(df[changed].head(preview_rows))
+        elif not removed:
+            updated.info("The change left every column as it was.")
+
+    except Exception as e:
+        st.error(f"Unexpected problem: {e}")
+
+def main():
+    client = get_client(load_api_key())
+
+    st.title("Excel Data Cleaner with AI Prompts (Groq Version)")
+
+    uploaded_file = st.file_uploader("Upload Excel/CSV file", type=["xlsx", "csv"])
+    if uploaded_file is None:
+        return
+
+    # --- Keep DataFrame in session state, re-parsing only when a different file is uploaded ---
+    data = uploaded_file.getvalue()
+    file_key = hashlib.md5(data).hexdigest()
+    if st.session_state.get("file_key") != file_key:
+        st.session_state.df = load_df(uploaded_file.name, data)
+        st.session_state.file_key = file_key
+        st.session_state.data_id = uuid.uuid4().hex
+        st.session_state.edits = 0
+        st.session_state.pop("prompt", None)
 
     df = st.session_state.df
 
+    # Only send a preview to the browser; the full data is available via download
+    preview_rows = st.number_input(
+        "Rows to preview", min_value=1, max_value=max(len(df), 1), value=min(len(df), 1000) or 1, step=100
+    )
+
     st.write("### Current Data")
-    st.dataframe(df)
+    st.dataframe(df.head(preview_rows))
 
     user_prompt = st.text_area(
         "Describe the cleaning changes you want (e.g., 'Remove characters after comma in column Name')"
     )
 
     if st.button("Apply Changes") and user_prompt:
-        try:
-            # --- Updated AI prompt ---
-            prompt_text = f"""
-            You are a safe and reliable Python data cleaning assistant.
-
-            IMPORTANT:
-            - You are working with an existing pandas DataFrame called `df` that is already loaded in memory.
-            - You MUST modify `df` **in place** — do NOT reassign it with new data from scratch.
-            - Do NOT read files or create new DataFrames unless explicitly told.
-            - Do NOT drop all data or reset the index unless explicitly told.
-            - Always check if a column exists before modifying or dropping it.
-            - Handle NaN values safely to avoid errors.
-            - Always convert to string before applying string operations:
-              df['col'] = df['col'].astype(str).apply(lambda x: <logic> if pd.notna(x) else x)
-            - Never call .upper(), .lower(), .split() directly on a Series — always use .str or .apply as above.
-            - Do not change numeric, percentage, or time formats unless explicitly instructed.
-            - When parsing dates, always use:
-              pd.to_datetime(df['col'].astype(str).str.strip(), errors='coerce')
-            - Avoid hardcoding example values — make your logic general.
-            - Return ONLY Python code that modifies `df` in place, without explanations or markdown.
-
-            Here are the first 10 rows of the current data:
-            {df.head(10).to_csv(index=False)}
-
-            User instruction:
-            {user_prompt}
-            """
-
-            # Send request to Groq
-            response = client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": prompt_text}],
-                temperature=0
-            )
-
-            raw_code = response.choices[0].message.content
-            raw_code = raw_code.replace("```python", "").replace("```", "").strip()
-
-            # Keep only lines that look like Python code
-            python_lines = []
-            for line in raw_code.splitlines():
-                stripped = line.strip()
-                if not stripped or stripped.startswith("#"):
-                    continue
-                if re.match(r"^[A-Za-z_][A-Za-z0-9_\[\]'\"]*\s*=.*", stripped) or \
-                   re.match(r"^(df|pd|if|for|from|import|with)\b", stripped):
-                    python_lines.append(line)
-
-            clean_code = textwrap.dedent("\n".join(python_lines)).strip()
-
-            # --- Auto-fixes ---
-            clean_code = re.sub(
-                r"pd\.to_datetime\(([^,]+),\s*format=.*?\)",
-                r"pd.to_datetime(\1.astype(str).str.strip(), errors='coerce')",
-                clean_code
-            )
-            clean_code = re.sub(
-                r"df\['(\w+)'\]\.upper\(\)",
-                r"df['\1'].astype(str).str.upper()",
-                clean_code
-            )
-            clean_code = re.sub(
-                r"df\['(\w+)'\]\.split\('([^']+)'\)\[0\]",
-                r"df['\1'].astype(str).apply(lambda x: x.split('\2')[0] if pd.notna(x) and len(x.split('\2'))>0 else x)",
-                clean_code
-            )
-            clean_code = re.sub(
-                r"df\['(\w+)'\]\.str\.split\('([^']+)'\)\[0\]",
-                r"df['\1'].astype(str).apply(lambda x: x.split('\2')[0] if pd.notna(x) and len(x.split('\2'))>0 else x)",
-                clean_code
-            )
-
-            def safe_split(match):
-                col = match.group(1)
-                sep = match.group(2)
-                idx = int(match.group(3))
-                return f"df['{col}'].astype(str).apply(lambda x: x.split('{sep}')[{idx}] if pd.notna(x) and len(x.split('{sep}'))>{idx} else x)"
-
-            clean_code = re.sub(
-                r"df\['(\w+)'\]\.split\('([^']+)'\)\[(\d+)\]",
-                safe_split,
-                clean_code
-            )
-            clean_code = re.sub(
-                r"df\['(\w+)'\]\.str\.split\('([^']+)'\)\[(\d+)\]",
-                safe_split,
-                clean_code
-            )
-
-            # Show generated code for review
-            st.write("### Generated Code")
-            st.code(clean_code, language="python")
-
-            # --- Execute with friendly error handling ---
-            try:
-                exec(clean_code, {"df": df, "pd": pd, "pd_notna": pd.notna})
-                st.session_state.df = df
-                st.success("Changes applied successfully!")
-            except Exception as e:
-                error_message = str(e).lower()
-
-                if "can only use .str accessor" in error_message:
-                    user_friendly = (
-                        "Your instruction is trying to use a text operation "
-                        "on a column that is not plain text. "
-                        "You may need to first convert it to text before making this change."
-                    )
-                elif "keyerror" in error_message:
-                    user_friendly = (
-                        "You mentioned a column name that doesn't exist in the data. "
-                        "Please check the exact name and try again."
-                    )
-                elif "valueerror" in error_message:
-                    user_friendly = (
-                        "Your change doesn't match the data format. "
-                        "Please adjust your instructions."
-                    )
-                else:
-                    user_friendly = (
-                        "Something went wrong while applying your change. "
-                        "Please review your instructions and try again."
-                    )
-
-                st.error(user_friendly)
-                st.info("No changes have been made. Please correct your prompt and try again.")
-                st.code(clean_code, language="python")
-                st.stop()
-
-            # Show updated dataframe
-            st.write("### Updated Data")
-            st.dataframe(df)
-
-            # Download button
-            csv = df.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                "Download Cleaned CSV",
-                data=csv,
-                file_name="cleaned_data.csv",
-                mime="text/csv"
-            )
+        apply_changes(client, df, user_prompt, preview_rows)
 
-        except Exception as e:
-            st.error(f"Unexpected problem: {e}")
+    # Download button: rendered on every rerun after an edit, so reruns reuse the cached CSV
+    if st.session_state.edits:
+        df_id = (st.session_state.data_id, st.session_state.edits)
+        csv = _csv_bytes(df_id, st.session_state.df)
+        st.download_button(
+            "Download Cleaned CSV",
+            data=csv,
+            file_name="cleaned_data.csv",
+            mime="text/csv"
+        )
 
+if __name__ == "__main__":
+    main()
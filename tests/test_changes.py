@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+from groq_vis import _changed_columns, _column_hashes
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"name": ["a b", "c"], "n": [1, 2], "flag": [0, 0]}).convert_dtypes(dtype_backend="pyarrow")
+
+
+def _diff(before, after):
+    return _changed_columns(_column_hashes(before), after)
+
+
+def test_unchanged(df):
+    assert _diff(df, df.copy()) == ([], [])
+
+
+def test_modified_and_added_columns(df):
+    after = df.copy()
+    after["n"] = after["n"] * 2
+    after["new"] = 1
+    assert _diff(df, after) == (["n", "new"], [])
+
+
+def test_list_column(df):
+    after = df.copy()
+    after["parts"] = after["name"].str.split(" ")
+    assert _diff(df, after) == (["parts"], [])
+    assert _diff(after, after.copy()) == ([], [])
+
+
+def test_dropped_column(df):
+    assert _diff(df, df.drop(columns=["flag"])) == ([], ["flag"])
+
+
+def test_renamed_column(df):
+    assert _diff(df, df.rename(columns={"n": "m"})) == (["m"], ["n"])
+
+
+def test_row_filter_touches_every_column(df):
+    assert _diff(df, df[df["n"] > 1]) == (["name", "n", "flag"], [])
+
+
+def test_index_change_touches_every_column():
+    before = pd.DataFrame({"z": [0, 0]})
+    assert _diff(before, pd.DataFrame({"z": [0, 0]}, index=[0, 2])) == (["z"], [])
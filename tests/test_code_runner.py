@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import code_runner
+from code_runner import run_code
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"name": ["a b", "c d"], "n": [1, 2]})
+
+
+@pytest.mark.parametrize("src", [
+    "df['x'] = pd.io.common.os.system('echo PWNED >&2; true')",
+    "import pandas.io.common",
+    "from pandas.io import common",
+    "from pandas import read_csv",
+    "df = pd.read_csv('/etc/passwd')",
+    "df.to_csv('/tmp/out.csv')",
+    "f = df.to_pickle",
+    "df.to_parquet('/tmp/out.parquet')",
+    "df['n'].to_clipboard()",
+    "import numpy as np\nnp.lib.format.os.system('true')",
+    "df['x'] = df._mgr",
+    "x = pd.eval('pd.io.common.os.system(\"true\")')",
+    "df.eval('@pd.io.common.os.system(\"true\")')",
+    "df = df.query('n > 1')",
+    "import numpy as np\nx = np.fromregex('/etc/hostname', '(.*)', [('line', 'U100')])",
+    "df.values.dump('/tmp/dumped.pkl')",
+    "x = pd.ExcelFile('/tmp/book.xlsx')",
+    "w = pd.ExcelWriter('/tmp/book.xlsx')",
+    "s = pd.HDFStore('/tmp/store.h5')",
+    "import os",
+    "while True:\n    pass",
+])
+def test_rejects_escapes(src, df):
+    with pytest.raises(ValueError, match="disallowed"):
+        run_code(src, df)
+
+
+def test_runs_allowed_code(df):
+    out = run_code("df['first'] = df['name'].str.split(' ').str[0]\ndf['n'] = pd.to_numeric(df['n']) * 2", df)
+    assert out["first"].tolist() == ["a", "c"]
+    assert out["n"].tolist() == [2, 4]
+
+
+def test_allows_in_memory_conversions(df):
+    df["d"] = pd.to_datetime(["2024-01-15", "2024-02-20"])
+    out = run_code(
+        "df['m'] = df['d'].dt.to_period('M').astype(str)\n"
+        "df['names'] = len(df['name'].to_list())\n"
+        "df['total'] = df['n'].to_numpy().sum()",
+        df,
+    )
+    assert out["m"].tolist() == ["2024-01", "2024-02"]
+    assert out["names"].tolist() == [2, 2]
+    assert out["total"].tolist() == [3, 3]
+
+
+def test_print_does_not_corrupt_result(df):
+    out = run_code("print(df.head())\ndf['n'] = df['n'] + 1", df)
+    assert out["n"].tolist() == [2, 3]
+
+
+def test_mixed_object_columns_still_run_in_child():
+    mixed = pd.DataFrame({"id": [1, "A2"], "n": [1, 2]})
+    with pytest.raises(TimeoutError):
+        run_code("for i in range(10**9):\n    pass", mixed, timeout=1)
+
+    out = run_code("df['n'] = df['n'] + 1", mixed)
+    assert out["id"].tolist() == ["1", "A2"]
+    assert out["n"].tolist() == [2, 3]
+
+
+@pytest.mark.parametrize("series", [
+    pd.Series(np.arange(50, dtype="float64")),
+    pd.Series([1.0, np.nan, 3.0] * 10),
+    pd.Series([1, None, 3] * 10).convert_dtypes(dtype_backend="pyarrow"),
+    pd.Series([1, 2, 3] * 10).convert_dtypes(dtype_backend="pyarrow"),
+], ids=["float", "float-nan", "arrow-int-na", "arrow-int"])
+def test_jit_map_matches_apply(series, monkeypatch):
+    pytest.importorskip("numba")
+    monkeypatch.setattr(code_runner, "_JIT_MIN_ROWS", 0)
+    fn = lambda x: x * 2 + 1  # noqa: E731
+    pd.testing.assert_series_equal(code_runner._jit_map(series, fn), series.apply(fn))
+
+
+def test_jit_map_falls_back_below_threshold():
+    series = pd.Series([1.0, np.nan, 3.0])
+    fn = lambda x: x * 2  # noqa: E731
+    pd.testing.assert_series_equal(code_runner._jit_map(series, fn), series.apply(fn))
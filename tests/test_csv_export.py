@@ -0,0 +1,35 @@
+import itertools
+
+import pandas as pd
+import pytest
+
+from groq_vis import _arrow_csv_table, _csv_bytes
+
+_ids = itertools.count()
+
+
+def _frames():
+    yield "text and ints", pd.DataFrame({"name": ["Bob", "Al", None], "n": [1, 2, 3]})
+    yield "arrow dtypes with NA", pd.DataFrame(
+        {"name": ["Bob", None, " x "], "n": [1, None, 3], "ok": [True, None, False]}
+    ).convert_dtypes(dtype_backend="pyarrow")
+    yield "numpy bools", pd.DataFrame({"name": ["a", "b"], "ok": [True, False]})
+    yield "value needing quotes", pd.DataFrame({"name": ["Smith, Bob", "Al"], "n": [1, 2]})
+    yield "embedded quote and newline", pd.DataFrame({"name": ['say "hi"', "a\nb"], "n": [1, 2]})
+    yield "floats", pd.DataFrame({"x": [2.0, 1.5, None], "n": [1, 2, 3]})
+    yield "timestamps", pd.DataFrame({"d": pd.to_datetime(["2024-01-01", None]), "n": [1, 2]})
+    yield "lists", pd.DataFrame({"parts": [["a", "b"], ["c"]], "n": [1, 2]})
+    yield "mixed objects", pd.DataFrame({"id": [1, "A2"], "n": [1, 2]})
+    yield "single column with empty value", pd.DataFrame({"name": ["a", "", None]})
+    yield "comma in header", pd.DataFrame({"a,b": ["x", "y"], "n": [1, 2]})
+
+
+@pytest.mark.parametrize("df", [df for _, df in _frames()], ids=[name for name, _ in _frames()])
+def test_matches_to_csv(df):
+    assert _csv_bytes(next(_ids), df) == df.to_csv(index=False).encode("utf-8")
+
+
+def test_uses_arrow_for_plain_columns():
+    df = pd.DataFrame({"name": ["Bob", "Al"], "n": [1, 2], "ok": [True, False]})
+    assert _arrow_csv_table(df) is not None
+    assert _arrow_csv_table(pd.DataFrame({"name": ["Smith, Bob", "Al"], "n": [1, 2]})) is None
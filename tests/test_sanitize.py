@@ -0,0 +1,53 @@
+import pandas as pd
+
+from code_runner import run_code
+from groq_vis import sanitize_code
+
+
+def test_strips_fences_and_prose():
+    raw = "Here you go:\n```python\n    df['a'] = 1\n    # note\n```\nThis sets a."
+    assert sanitize_code(raw) == "df['a'] = 1"
+
+
+def test_split_index_is_vectorized():
+    expected = "df['c'] = df['c'].astype('string').str.split(',', n=1, regex=False).str[0]"
+    assert sanitize_code("df['c'] = df['c'].split(',')[0]") == expected
+    assert sanitize_code("df['c'] = df['c'].str.split(',')[0]") == expected
+
+
+def test_split_out_of_range_index_gives_na():
+    code = sanitize_code("df['c'] = df['c'].split(',')[2]")
+    assert ".str.split(',', n=3, regex=False).str[2]" in code
+
+    out = run_code(code, pd.DataFrame({"c": ["a,b,c", "a", None]}))
+    assert out["c"].iloc[0] == "c"
+    assert out["c"].iloc[1:].isna().all()
+
+
+def test_upper():
+    assert sanitize_code("df['c'] = df['c'].upper()") == "df['c'] = df['c'].astype('string').str.upper()"
+
+
+def test_to_datetime_format_is_dropped():
+    code = sanitize_code("df['d'] = pd.to_datetime(df['d'], format='%Y-%m-%d')")
+    assert code == "df['d'] = pd.to_datetime(df['d'].astype(str).str.strip(), errors='coerce')"
+
+
+def test_numeric_apply_uses_jit_map():
+    code = sanitize_code("df['n'] = df['n'].apply(lambda x: x * 2)", frozenset({"n"}))
+    assert code == "df['n'] = _jit_map(df['n'], lambda x: x * 2)"
+
+
+def test_string_apply_is_left_alone():
+    src = "df['s'] = df['s'].apply(lambda x: x + 'b')"
+    assert sanitize_code(src, frozenset({"n"})) == src
+
+
+def test_unparseable_code_passes_through():
+    src = "df['a'] = df['a'].split(',')[0] +"
+    assert sanitize_code(src) == src
+
+
+def test_string_literals_are_not_rewritten():
+    src = 'x = "df[\'a\'].upper()"'
+    assert sanitize_code(src) == "x = \"df['a'].upper()\""